@@ -0,0 +1,39 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+
+try:
+    from torch.testing import assert_close as _assert_close
+except ImportError:
+    # torch.testing.assert_close is only available since PyTorch 1.9.0, and
+    # the CI still tests PyTorch 1.8.1
+    from torch.testing import assert_allclose as _assert_close
+
+
+@pytest.fixture
+def assert_close():
+    """``torch.testing.assert_close``, or ``assert_allclose`` before 1.9."""
+    return _assert_close
+
+
+_warmed_up_devices = set()
+
+
+@pytest.fixture(autouse=True)
+def warmup_device(request):
+    """Initialize the device of a device-parametrized test on first use.
+
+    The context creation and allocator warmup then run in fixture setup
+    instead of inside the first test call on that device. This does not
+    make the warmup free; it only moves where its time is reported. Only
+    devices that selected tests are parametrized with get initialized, so
+    CPU-only runs and tests that pick their own device (e.g. the SLURM
+    ranks of test_syncbn) do not create any device context here.
+    """
+    callspec = getattr(request.node, 'callspec', None)
+    device = callspec.params.get('device') if callspec else None
+    if not isinstance(device, str) or device == 'cpu':
+        return
+    if device not in _warmed_up_devices:
+        torch.ones(1, device=device).add_(1).cpu()
+        _warmed_up_devices.add(device)
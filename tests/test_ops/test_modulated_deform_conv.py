@@ -1,14 +1,18 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import copy
 import os
 
-import numpy
 import pytest
 import torch
 from mmengine.utils import digit_version
 from mmengine.utils.dl_utils import TORCH_VERSION
 
+from mmcv.ops import ModulatedDeformConv2dPack
 from mmcv.utils import IS_CUDA_AVAILABLE, IS_MLU_AVAILABLE
 
+if IS_MLU_AVAILABLE:
+    from mmcv.ops import ModulatedDeformConv2dPack_MLU
+
 try:
     # If PyTorch version >= 1.6.0 and fp16 is enabled, torch.cuda.amp.autocast
     # would be imported and used; we should test if our modules support it.
@@ -18,6 +22,15 @@ except ImportError:
 
 cur_dir = os.path.dirname(os.path.abspath(__file__))
 
+# amp (torch.cuda.amp.autocast) is only available on PyTorch >= 1.6.0
+_AMP_AVAILABLE = (
+    TORCH_VERSION != 'parrots'
+    and digit_version(TORCH_VERSION) >= digit_version('1.6.0'))
+
+# map devices with a dedicated implementation to their pack class; every
+# other device falls back to ``ModulatedDeformConv2dPack``
+_PACK = {'mlu': ModulatedDeformConv2dPack_MLU} if IS_MLU_AVAILABLE else {}
+
 input_t = [[[[1., 2., 3.], [1., 2., 3.], [1., 2., 3.]]]]
 output_t = [[[[0.5, 1.5, 2.5, 1.5], [1.0, 3.0, 5.0, 3.0], [1.0, 3.0, 5.0, 3.0],
               [0.5, 1.5, 2.5, 1.5]]]]
@@ -38,132 +51,174 @@ dcn_offset_b_grad = [
     -3.0, -1.5, -3.0, -1.5, -3.0, -1.5, -3.0, -1.5, 4.5, 4.5, 4.5, 4.5
 ]
 
+# parse the reference data once; each test only casts and moves it
+_INPUT_CPU = torch.tensor(input_t)
+_OUTPUT_REF = torch.tensor(output_t)
+_INPUT_GRAD_REF = torch.tensor(input_grad)
+_DCN_W_GRAD_REF = torch.tensor(dcn_w_grad)
+_DCN_OFFSET_W_GRAD_REF = torch.tensor(dcn_offset_w_grad)
+_DCN_OFFSET_B_GRAD_REF = torch.tensor(dcn_offset_b_grad)
+
+
+def _check_mdconv_results(output, input, dcn, assert_close):
+    """Check the output and gradients of a mdconv forward/backward pass.
+
+    Every comparison runs on device and the five results are gathered into
+    a single tensor, so only one device-to-host transfer is needed. A
+    mismatch is re-checked with ``assert_close`` (the conftest fixture) for
+    a detailed report.
+    """
+    results = [
+        ('output', output.detach(), _OUTPUT_REF),
+        ('input.grad', input.grad, _INPUT_GRAD_REF),
+        ('weight.grad', dcn.weight.grad, _DCN_W_GRAD_REF),
+        ('conv_offset.weight.grad', dcn.conv_offset.weight.grad,
+         _DCN_OFFSET_W_GRAD_REF),
+        ('conv_offset.bias.grad', dcn.conv_offset.bias.grad,
+         _DCN_OFFSET_B_GRAD_REF),
+    ]
+    close = torch.stack([
+        torch.isclose(actual, expected.to(actual), 1e-2).all()
+        for _, actual, expected in results
+    ]).cpu().tolist()
+    for (name, actual, expected), is_close in zip(results, close):
+        if not is_close:
+            assert_close(actual, expected.to(actual), rtol=1e-2, atol=1e-8)
+        # assert_close may accept what isclose rejected (e.g. the
+        # equal_nan=True default of assert_allclose), so always fail here
+        assert is_close, f'{name} mismatches the reference'
+
+
+def _run_and_check_mdconv(dcn, input, assert_close):
+    """Run forward and backward of ``dcn`` on ``input``, then check them.
+
+    All kernels are queued without any host synchronization in between;
+    the single flag transfer in :func:`_check_mdconv_results` is the only
+    point where the host waits for the device.
+    """
+    output = dcn(input)
+    output.sum().backward()
+    _check_mdconv_results(output, input, dcn, assert_close)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def cudnn_benchmark():
+    # every case runs the offset conv with identical shapes, so let cuDNN
+    # pick its algorithm once; restore the flag for other tests
+    benchmark = torch.backends.cudnn.benchmark
+    torch.backends.cudnn.benchmark = True
+
+    yield
+
+    torch.backends.cudnn.benchmark = benchmark
+
+
+@pytest.fixture(scope='module')
+def dcn_factory():
+    """Build each mdconv module once per (device, dtype) and hand out copies.
+
+    The default float32 module is also the one amp expects, so float and amp
+    cases share a single cached module per device.
+    """
+    cache = {}
+
+    def make(device, dtype=torch.float):
+        if (device, dtype) not in cache:
+            Pack = _PACK.get(device, ModulatedDeformConv2dPack)
+            dcn = Pack(
+                1,
+                1,
+                kernel_size=(2, 2),
+                stride=1,
+                padding=1,
+                deform_groups=1,
+                bias=False).to(device)
+            dcn.weight.data.fill_(1.)
+            dcn.type(dtype)
+            cache[(device, dtype)] = dcn
+        return copy.deepcopy(cache[(device, dtype)])
+
+    return make
 
-class TestMdconv:
-
-    def _test_mdconv(self, dtype=torch.float, device='cuda'):
-        if not torch.cuda.is_available() and device == 'cuda':
-            pytest.skip('test requires GPU')
-        if device == 'mlu':
-            from mmcv.ops import \
-                ModulatedDeformConv2dPack_MLU as ModulatedDeformConv2dPack
-        else:
-            from mmcv.ops import ModulatedDeformConv2dPack
-
-        input = torch.tensor(input_t, dtype=dtype, device=device)
-        input.requires_grad = True
-
-        dcn = ModulatedDeformConv2dPack(
-            1,
-            1,
-            kernel_size=(2, 2),
-            stride=1,
-            padding=1,
-            deform_groups=1,
-            bias=False).to(device)
-
-        dcn.weight.data.fill_(1.)
-        dcn.type(dtype)
-        output = dcn(input)
-        output.sum().backward()
-        assert numpy.allclose(output.cpu().detach().numpy(), output_t, 1e-2)
-        assert numpy.allclose(input.grad.cpu().detach().numpy(), input_grad,
-                              1e-2)
-        assert numpy.allclose(dcn.weight.grad.cpu().detach().numpy(),
-                              dcn_w_grad, 1e-2)
-        assert numpy.allclose(
-            dcn.conv_offset.weight.grad.cpu().detach().numpy(),
-            dcn_offset_w_grad, 1e-2)
-        assert numpy.allclose(dcn.conv_offset.bias.grad.cpu().detach().numpy(),
-                              dcn_offset_b_grad, 1e-2)
-
-    def _test_amp_mdconv(self, input_dtype=torch.float, device='cuda'):
-        """The function to test amp released on pytorch 1.6.0.
 
-        The type of input data might be torch.float or torch.half,
-        so we should test mdconv in both cases. With amp, the data
-        type of model will NOT be set manually.
+class TestMdconv:
 
-        Args:
-            input_dtype: torch.float or torch.half.
-        """
-        if not torch.cuda.is_available() and device == 'cuda':
-            return
-        if device == 'mlu':
-            from mmcv.ops import \
-                ModulatedDeformConv2dPack_MLU as ModulatedDeformConv2dPack
-        else:
-            from mmcv.ops import ModulatedDeformConv2dPack
-
-        input = torch.tensor(input_t).to(device).type(input_dtype)
-        input.requires_grad = True
-
-        dcn = ModulatedDeformConv2dPack(
-            1,
-            1,
-            kernel_size=(2, 2),
-            stride=1,
-            padding=1,
-            deform_groups=1,
-            bias=False).to(device)
-        dcn.weight.data.fill_(1.)
-        output = dcn(input)
-        output.sum().backward()
-        assert numpy.allclose(output.cpu().detach().numpy(), output_t, 1e-2)
-        assert numpy.allclose(input.grad.cpu().detach().numpy(), input_grad,
-                              1e-2)
-        assert numpy.allclose(dcn.weight.grad.cpu().detach().numpy(),
-                              dcn_w_grad, 1e-2)
-        assert numpy.allclose(
-            dcn.conv_offset.weight.grad.cpu().detach().numpy(),
-            dcn_offset_w_grad, 1e-2)
-        assert numpy.allclose(dcn.conv_offset.bias.grad.cpu().detach().numpy(),
-                              dcn_offset_b_grad, 1e-2)
-
-    @pytest.mark.parametrize('device', [
-        'cpu',
+    @pytest.mark.parametrize('device, dtype', [
+        ('cpu', torch.float),
+        ('cpu', torch.double),
         pytest.param(
             'cuda',
+            torch.float,
             marks=pytest.mark.skipif(
                 not IS_CUDA_AVAILABLE, reason='requires CUDA support')),
         pytest.param(
-            'mlu',
+            'cuda',
+            torch.double,
             marks=pytest.mark.skipif(
-                not IS_MLU_AVAILABLE, reason='requires MLU support')),
-    ])
-    def test_mdconv_float(self, device):
-        self._test_mdconv(dtype=torch.float, device=device)
-
-    @pytest.mark.parametrize('device', [
-        'cpu',
+                not IS_CUDA_AVAILABLE, reason='requires CUDA support')),
         pytest.param(
             'cuda',
+            torch.half,
             marks=pytest.mark.skipif(
                 not IS_CUDA_AVAILABLE, reason='requires CUDA support')),
         pytest.param(
             'mlu',
+            torch.float,
+            marks=pytest.mark.skipif(
+                not IS_MLU_AVAILABLE, reason='requires MLU support')),
+        pytest.param(
+            'mlu',
+            torch.double,
+            marks=pytest.mark.skipif(
+                not IS_MLU_AVAILABLE, reason='requires MLU support')),
+        pytest.param(
+            'mlu',
+            torch.half,
             marks=pytest.mark.skipif(
                 not IS_MLU_AVAILABLE, reason='requires MLU support')),
     ])
-    def test_mdconv_double(self, device):
-        self._test_mdconv(dtype=torch.double, device=device)
+    def test_mdconv(self, dcn_factory, assert_close, device, dtype):
+        input = _INPUT_CPU.to(
+            device=device, dtype=dtype).clone().requires_grad_()
+
+        dcn = dcn_factory(device, dtype)
+        _run_and_check_mdconv(dcn, input, assert_close)
 
-    @pytest.mark.parametrize('device', [
+    @pytest.mark.parametrize('device, input_dtype', [
         pytest.param(
             'cuda',
+            torch.float,
+            marks=pytest.mark.skipif(
+                not IS_CUDA_AVAILABLE, reason='requires CUDA support')),
+        pytest.param(
+            'cuda',
+            torch.half,
             marks=pytest.mark.skipif(
                 not IS_CUDA_AVAILABLE, reason='requires CUDA support')),
         pytest.param(
             'mlu',
+            torch.float,
+            marks=pytest.mark.skipif(
+                not IS_MLU_AVAILABLE, reason='requires MLU support')),
+        pytest.param(
+            'mlu',
+            torch.half,
             marks=pytest.mark.skipif(
                 not IS_MLU_AVAILABLE, reason='requires MLU support')),
     ])
-    def test_mdconv_half(self, device):
-        self._test_mdconv(torch.half, device=device)
-        # test amp when torch version >= '1.6.0', the type of
-        # input data for mdconv might be torch.float or torch.half
-        if (TORCH_VERSION != 'parrots'
-                and digit_version(TORCH_VERSION) >= digit_version('1.6.0')):
-            with autocast(enabled=True):
-                self._test_amp_mdconv(torch.float, device=device)
-                self._test_amp_mdconv(torch.half, device=device)
+    @pytest.mark.skipif(
+        not _AMP_AVAILABLE, reason='amp requires PyTorch >= 1.6.0')
+    def test_mdconv_amp(self, dcn_factory, assert_close, device,
+                        input_dtype):
+        """Test mdconv with amp released on pytorch 1.6.0.
+
+        The type of input data might be torch.float or torch.half,
+        so we should test mdconv in both cases. With amp, the data
+        type of model will NOT be set manually.
+        """
+        input = _INPUT_CPU.to(
+            device=device, dtype=input_dtype).clone().requires_grad_()
+
+        dcn = dcn_factory(device)
+        with autocast(enabled=True):
+            _run_and_check_mdconv(dcn, input, assert_close)
@@ -1,10 +1,96 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import functools
+
 import pytest
 import torch
 
 from mmcv.ops import three_interpolate
 from mmcv.utils import IS_CUDA_AVAILABLE, IS_NPU_AVAILABLE
 
+# reference tensors are parsed once on CPU in double precision and only
+# cast/moved inside each test, see ``_to_device``
+_FEATURES_CPU = torch.tensor(
+    [[[2.4350, 4.7516, 4.4995, 2.4350, 2.4350, 2.4350],
+      [3.1236, 2.6278, 3.0447, 3.1236, 3.1236, 3.1236],
+      [2.6732, 2.8677, 2.6436, 2.6732, 2.6732, 2.6732],
+      [0.0124, 7.0150, 7.0199, 0.0124, 0.0124, 0.0124],
+      [0.3207, 0.0000, 0.3411, 0.3207, 0.3207, 0.3207]],
+     [[0.0000, 0.9544, 2.4532, 0.0000, 0.0000, 0.0000],
+      [0.5346, 1.9176, 1.4715, 0.5346, 0.5346, 0.5346],
+      [0.0000, 0.2744, 2.0842, 0.0000, 0.0000, 0.0000],
+      [0.3414, 1.5063, 1.6209, 0.3414, 0.3414, 0.3414],
+      [0.5814, 0.0103, 0.0000, 0.5814, 0.5814, 0.5814]]],
+    dtype=torch.double)
+
+# built as int32 directly, so no int64 tensor or cast kernel is involved
+_IDX_CPU = torch.tensor(
+    [[[0, 1, 2], [2, 3, 4], [2, 3, 4], [0, 1, 2], [0, 1, 2], [0, 1, 3]],
+     [[0, 2, 3], [1, 3, 4], [2, 1, 4], [0, 2, 4], [0, 2, 4], [0, 1, 2]]],
+    dtype=torch.int)
+
+_WEIGHT_CPU = torch.tensor([[[3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [1.0000e+00, 5.8155e-08, 2.2373e-08],
+                             [1.0000e+00, 1.7737e-08, 1.7356e-08],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01]],
+                            [[3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [1.0000e+00, 1.3651e-08, 7.7312e-09],
+                             [1.0000e+00, 1.7148e-08, 1.4070e-08],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01],
+                             [3.3333e-01, 3.3333e-01, 3.3333e-01]]],
+                           dtype=torch.double)
+
+_EXPECTED_CPU = torch.tensor(
+    [[[3.8953e+00, 4.4995e+00, 4.4995e+00,
+       3.8953e+00, 3.8953e+00, 3.2072e+00],
+      [2.9320e+00, 3.0447e+00, 3.0447e+00,
+       2.9320e+00, 2.9320e+00, 2.9583e+00],
+      [2.7281e+00, 2.6436e+00, 2.6436e+00,
+       2.7281e+00, 2.7281e+00, 2.7380e+00],
+      [4.6824e+00, 7.0199e+00, 7.0199e+00,
+       4.6824e+00, 4.6824e+00, 2.3466e+00],
+      [2.2060e-01, 3.4110e-01, 3.4110e-01,
+       2.2060e-01, 2.2060e-01, 2.1380e-01]],
+     [[8.1773e-01, 9.5440e-01, 2.4532e+00,
+       8.1773e-01, 8.1773e-01, 1.1359e+00],
+      [8.4689e-01, 1.9176e+00, 1.4715e+00,
+       8.4689e-01, 8.4689e-01, 1.3079e+00],
+      [6.9473e-01, 2.7440e-01, 2.0842e+00,
+       6.9473e-01, 6.9473e-01, 7.8619e-01],
+      [7.6789e-01, 1.5063e+00, 1.6209e+00,
+       7.6789e-01, 7.6789e-01, 1.1562e+00],
+      [3.8760e-01, 1.0300e-02, 8.3569e-09,
+       3.8760e-01, 3.8760e-01, 1.9723e-01]]],
+    dtype=torch.double)
+
+_REFERENCES = {
+    'features': _FEATURES_CPU,
+    'idx': _IDX_CPU,
+    'weight': _WEIGHT_CPU,
+    'expected': _EXPECTED_CPU,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _pinned(name, dtype):
+    return _REFERENCES[name].to(dtype).pin_memory()
+
+
+def _to_device(name, device, dtype=None):
+    """Cast the reference ``name`` to ``dtype`` and copy it to ``device``.
+
+    For CUDA, the cast host copy is pinned on first use and cached per
+    (name, dtype), so the transfer is really asynchronous and CUDA is not
+    initialized during test collection.
+    """
+    tensor = _REFERENCES[name]
+    dtype = tensor.dtype if dtype is None else dtype
+    if device != 'cuda':
+        return tensor.to(device=device, dtype=dtype)
+    return _pinned(name, dtype).to(device, non_blocking=True)
+
 
 @pytest.mark.parametrize('dtype', [
     torch.half, torch.float,
@@ -24,74 +110,12 @@ from mmcv.utils import IS_CUDA_AVAILABLE, IS_NPU_AVAILABLE
         marks=pytest.mark.skipif(
             not IS_NPU_AVAILABLE, reason='requires NPU support'))
 ])
-def test_three_interpolate(dtype, device):
-    features = torch.tensor(
-        [[[2.4350, 4.7516, 4.4995, 2.4350, 2.4350, 2.4350],
-          [3.1236, 2.6278, 3.0447, 3.1236, 3.1236, 3.1236],
-          [2.6732, 2.8677, 2.6436, 2.6732, 2.6732, 2.6732],
-          [0.0124, 7.0150, 7.0199, 0.0124, 0.0124, 0.0124],
-          [0.3207, 0.0000, 0.3411, 0.3207, 0.3207, 0.3207]],
-         [[0.0000, 0.9544, 2.4532, 0.0000, 0.0000, 0.0000],
-          [0.5346, 1.9176, 1.4715, 0.5346, 0.5346, 0.5346],
-          [0.0000, 0.2744, 2.0842, 0.0000, 0.0000, 0.0000],
-          [0.3414, 1.5063, 1.6209, 0.3414, 0.3414, 0.3414],
-          [0.5814, 0.0103, 0.0000, 0.5814, 0.5814, 0.5814]]],
-        dtype=dtype,
-        device=device)
-
-    idx = torch.tensor(
-        [[[0, 1, 2], [2, 3, 4], [2, 3, 4], [0, 1, 2], [0, 1, 2], [0, 1, 3]],
-         [[0, 2, 3], [1, 3, 4], [2, 1, 4], [0, 2, 4], [0, 2, 4], [0, 1, 2]]],
-        device=device).int()
-
-    weight = torch.tensor([[[3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [1.0000e+00, 5.8155e-08, 2.2373e-08],
-                            [1.0000e+00, 1.7737e-08, 1.7356e-08],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01]],
-                           [[3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [1.0000e+00, 1.3651e-08, 7.7312e-09],
-                            [1.0000e+00, 1.7148e-08, 1.4070e-08],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01],
-                            [3.3333e-01, 3.3333e-01, 3.3333e-01]]],
-                          dtype=dtype,
-                          device=device)
+def test_three_interpolate(assert_close, dtype, device):
+    features = _to_device('features', device, dtype)
+    idx = _to_device('idx', device)
+    weight = _to_device('weight', device, dtype)
 
     output = three_interpolate(features, idx, weight)
-    expected_output = torch.tensor([[[
-        3.8953e+00, 4.4995e+00, 4.4995e+00, 3.8953e+00, 3.8953e+00, 3.2072e+00
-    ], [
-        2.9320e+00, 3.0447e+00, 3.0447e+00, 2.9320e+00, 2.9320e+00, 2.9583e+00
-    ], [
-        2.7281e+00, 2.6436e+00, 2.6436e+00, 2.7281e+00, 2.7281e+00, 2.7380e+00
-    ], [
-        4.6824e+00, 7.0199e+00, 7.0199e+00, 4.6824e+00, 4.6824e+00, 2.3466e+00
-    ], [
-        2.2060e-01, 3.4110e-01, 3.4110e-01, 2.2060e-01, 2.2060e-01, 2.1380e-01
-    ]],
-                                    [[
-                                        8.1773e-01, 9.5440e-01, 2.4532e+00,
-                                        8.1773e-01, 8.1773e-01, 1.1359e+00
-                                    ],
-                                     [
-                                         8.4689e-01, 1.9176e+00, 1.4715e+00,
-                                         8.4689e-01, 8.4689e-01, 1.3079e+00
-                                     ],
-                                     [
-                                         6.9473e-01, 2.7440e-01, 2.0842e+00,
-                                         6.9473e-01, 6.9473e-01, 7.8619e-01
-                                     ],
-                                     [
-                                         7.6789e-01, 1.5063e+00, 1.6209e+00,
-                                         7.6789e-01, 7.6789e-01, 1.1562e+00
-                                     ],
-                                     [
-                                         3.8760e-01, 1.0300e-02, 8.3569e-09,
-                                         3.8760e-01, 3.8760e-01, 1.9723e-01
-                                     ]]],
-                                   dtype=dtype,
-                                   device=device)
-
-    assert torch.allclose(output, expected_output, 1e-3, 1e-4)
+    expected_output = _to_device('expected', device, dtype)
+
+    assert_close(output, expected_output, rtol=1e-3, atol=1e-4)